@@ -1,10 +1,14 @@
 import os
-import shutil
+import asyncio
+import hashlib
+import tempfile
+import time
 import json
+from contextlib import asynccontextmanager
 from typing import List, Optional
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles # Import StaticFiles
 from mutagen.mp3 import MP3
@@ -14,12 +18,32 @@ from mutagen.oggvorbis import OggVorbis
 
 # Import the analytics functions from main.py
 import main as analytics
+from main import SUPPORTED_EXTS
+import fast_duration
+
+# Buffer size for copying uploaded files to disk; large reads keep syscall overhead low
+UPLOAD_COPY_BUFSIZE = 16 * 1024 * 1024
+
+# Largest text delta sent in one server-sent event by /analyze_audio/stream
+STREAM_MAX_DELTA = 512
+
+# How long a /list_audio result is reused, so bursts of polling share one scan
+LIST_AUDIO_TTL = 5.0
+
+@asynccontextmanager
+async def lifespan(app):
+    """Restores the audio duration cache on startup and persists it on shutdown."""
+    load_duration_cache()
+    yield
+    save_duration_cache()
+
 
 # Initialize the FastAPI app
 app = FastAPI(
     title="Call Center Analytics API",
     description="An API to analyze call center audio recordings using Gemini.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Add CORS Middleware
@@ -29,6 +53,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets browser clients read the content-hash id of their uploads
+    expose_headers=["X-Audio-Id"],
 )
 
 # --- FIX: Mount a directory to serve the audio files ---
@@ -39,8 +65,64 @@ app.mount("/audio", StaticFiles(directory=analytics.AUDIO_DIR), name="audio")
 # Load configuration at startup
 config = analytics.load_config()
 
-def get_audio_duration(filepath):
+# Resolve directories once instead of normalizing paths on every request
+AUDIO_DIR_ABS = os.path.abspath(analytics.AUDIO_DIR)
+ANALYSIS_DIR_ABS = os.path.abspath(analytics.ANALYSIS_DIR)
+
+# Audio durations keyed by (path, mtime, size) so unchanged files are never re-parsed
+DURATION_CACHE_PATH = os.path.join(analytics.ANALYSIS_DIR, ".duration_cache.json")
+_DURATION_CACHE: dict[tuple[str, int, int], float] = {}
+
+# Last /list_audio result as (expiry time, payload), refreshed under the lock
+_LIST_SNAPSHOT: Optional[tuple[float, dict]] = None
+_LIST_LOCK = asyncio.Lock()
+# Bumped whenever the audio directory changes, so a scan that started earlier
+# doesn't store its outdated result as the snapshot
+_LIST_GENERATION = 0
+
+
+def load_duration_cache():
+    """Loads previously computed audio durations from disk, if available."""
+    try:
+        with open(DURATION_CACHE_PATH, 'r') as f:
+            entries = json.load(f)
+        for path, mtime_ns, size, duration in entries:
+            _DURATION_CACHE[(path, mtime_ns, size)] = duration
+    except (OSError, ValueError, TypeError):
+        pass
+
+
+def save_duration_cache():
+    """Persists the audio duration cache to disk."""
+    entries = []
+    for key, duration in _DURATION_CACHE.items():
+        # Drop entries for files that were deleted or have changed since
+        path, mtime_ns, size = key
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if (st.st_mtime_ns, st.st_size) == (mtime_ns, size):
+            entries.append([*key, duration])
+    # Each worker process saves its own cache, so write to a private file and
+    # swap it in atomically to keep concurrent shutdowns from interleaving
+    temp_path = f"{DURATION_CACHE_PATH}.{os.getpid()}"
+    try:
+        with open(temp_path, 'w') as f:
+            json.dump(entries, f)
+        os.replace(temp_path, DURATION_CACHE_PATH)
+    except OSError as e:
+        print(f"Warning: Could not save duration cache. Error: {e}")
+
+
+def _compute_audio_duration(filepath):
     """Calculates the duration of an audio file in minutes."""
+    try:
+        return round(fast_duration.audio_duration(filepath) / 60, 2)
+    except (OSError, ValueError):
+        pass
+
+    # Fall back to a full mutagen parse if the header-only read fails
     try:
         if filepath.lower().endswith('.mp3'):
             audio = MP3(filepath)
@@ -56,63 +138,295 @@ def get_audio_duration(filepath):
     except Exception:
         return 0
 
+
+def get_audio_duration(filepath, st=None):
+    """Returns the duration of an audio file in minutes, using the cache when possible."""
+    if st is None:
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return 0
+    key = (filepath, st.st_mtime_ns, st.st_size)
+    duration = _DURATION_CACHE.get(key)
+    if duration is None:
+        duration = _compute_audio_duration(filepath)
+        _DURATION_CACHE[key] = duration
+    return duration
+
+
+def get_entry_duration(entry):
+    """Returns the duration of a scanned directory entry, reusing its cached stat."""
+    try:
+        st = entry.stat()
+    except OSError:
+        return 0
+    return get_audio_duration(entry.path, st)
+
+
+def resolve_id(directory, value, field):
+    """
+    Returns the path of the file an id names inside directory. Ids must be plain,
+    non-hidden file names, so they can't reach outside it.
+    """
+    path = os.path.abspath(os.path.join(directory, value))
+    if (
+        os.path.basename(value) != value
+        or value.startswith(".")
+        or "\0" in value
+        or os.path.commonpath([directory, path]) != directory
+    ):
+        raise HTTPException(status_code=400, detail=f"Invalid {field} '{value}'.")
+    return path
+
+
+def invalidate_audio_list():
+    """Drops the cached /list_audio result so the next request rescans."""
+    global _LIST_SNAPSHOT, _LIST_GENERATION
+    _LIST_GENERATION += 1
+    _LIST_SNAPSHOT = None
+
+
+def new_upload_hasher():
+    """Returns the hasher used to derive content-addressed upload ids."""
+    return hashlib.blake2b(digest_size=analytics.CONTENT_HASH_SIZE)
+
+
+def hash_upload(source):
+    """Hashes an uploaded file object and rewinds it for the next reader."""
+    hasher = new_upload_hasher()
+    while chunk := source.read(UPLOAD_COPY_BUFSIZE):
+        hasher.update(chunk)
+    source.seek(0)
+    return hasher.hexdigest()
+
+
+def save_upload(source, extension):
+    """
+    Writes an uploaded file object to the audio directory, named after a hash
+    of its contents so repeated uploads map to the same audio id.
+
+    Returns:
+        str: The path of the saved audio file.
+    """
+    hasher = new_upload_hasher()
+    fd, temp_path = tempfile.mkstemp(prefix=".upload-", suffix=".part", dir=AUDIO_DIR_ABS)
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while chunk := source.read(UPLOAD_COPY_BUFSIZE):
+                hasher.update(chunk)
+                buffer.write(chunk)
+        audio_path = os.path.join(AUDIO_DIR_ABS, hasher.hexdigest() + extension)
+        if os.path.exists(audio_path):
+            # Same contents are already stored; keep that file and its mtime
+            os.unlink(temp_path)
+        else:
+            os.replace(temp_path, audio_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return audio_path
+
+
+async def scan_audio_files():
+    """Scans the audio directory and returns the supported files with their durations."""
+    with os.scandir(AUDIO_DIR_ABS) as it:
+        entries = [
+            entry for entry in it
+            if entry.is_file() and entry.name.lower().endswith(SUPPORTED_EXTS)
+            # Hidden files (e.g. in-progress uploads) can't be used as an audio_id
+            and not entry.name.startswith(".")
+        ]
+    # Parse the audio headers in parallel on the default threadpool so the
+    # event loop keeps serving other requests while the directory is scanned.
+    durations = await asyncio.gather(
+        *(asyncio.to_thread(get_entry_duration, entry) for entry in entries)
+    )
+    audio_files = [
+        {
+            "filename": entry.name,
+            "path": entry.path,
+            "duration_mins": duration
+        }
+        for entry, duration in zip(entries, durations)
+    ]
+    return {"audio_files": audio_files}
+
+
 @app.get("/list_audio", summary="List all available audio files")
-def list_audio():
+async def list_audio():
     """
     Scans the designated audio directory and returns a list of all
     supported audio files found, including their duration.
     """
-    supported_formats = ['.mp3', '.wav', '.m4a', '.ogg']
-    audio_files = []
+    global _LIST_SNAPSHOT
     try:
-        for filename in os.listdir(analytics.AUDIO_DIR):
-            if any(filename.lower().endswith(fmt) for fmt in supported_formats):
-                file_path = os.path.abspath(os.path.join(analytics.AUDIO_DIR, filename))
-                duration = get_audio_duration(file_path)
-                audio_files.append({
-                    "filename": filename,
-                    "path": file_path,
-                    "duration_mins": duration
-                })
-        return {"audio_files": audio_files}
+        snapshot = _LIST_SNAPSHOT
+        if snapshot is not None and time.monotonic() < snapshot[0]:
+            return snapshot[1]
+        async with _LIST_LOCK:
+            # Another request may have refreshed the snapshot while we waited
+            snapshot = _LIST_SNAPSHOT
+            if snapshot is not None and time.monotonic() < snapshot[0]:
+                return snapshot[1]
+            generation = _LIST_GENERATION
+            result = await scan_audio_files()
+            if generation == _LIST_GENERATION:
+                _LIST_SNAPSHOT = (time.monotonic() + LIST_AUDIO_TTL, result)
+            return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/analyze_audio", summary="Analyze an audio file")
-async def analyze_audio(
-    audio_id: Optional[str] = Form(None),
-    file: Optional[UploadFile] = File(None)
-):
+async def resolve_audio_input(audio_id, file, save_file):
+    """
+    Works out which audio to analyze from the request form.
+
+    Returns:
+        tuple: The audio path and, for unsaved uploads, the stream to send instead.
+    """
     if not audio_id and not file:
         raise HTTPException(status_code=400, detail="You must provide either an 'audio_id' or upload a 'file'.")
 
+    audio_stream = None
     if file:
-        audio_path = os.path.join(analytics.AUDIO_DIR, file.filename)
-        with open(audio_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Uploads are stored under their content hash; only the extension is kept
+        extension = os.path.splitext(file.filename or "")[1].lower()
+        if extension not in SUPPORTED_EXTS:
+            raise HTTPException(status_code=400, detail=f"Unsupported audio file format: '{file.filename}'.")
+        if save_file:
+            # Copy on a worker thread so concurrent uploads don't block the event loop
+            audio_path = await asyncio.to_thread(save_upload, file.file, extension)
+            invalidate_audio_list()
+        else:
+            # Stream the upload straight to Gemini without archiving it locally
+            content_hash = await asyncio.to_thread(hash_upload, file.file)
+            audio_path = os.path.join(AUDIO_DIR_ABS, content_hash + extension)
+            audio_stream = file.file
     else:
-        audio_path = os.path.join(analytics.AUDIO_DIR, audio_id)
+        audio_path = resolve_id(AUDIO_DIR_ABS, audio_id, "audio_id")
         if not os.path.exists(audio_path):
             raise HTTPException(status_code=404, detail=f"Audio file with id '{audio_id}' not found.")
 
-    analysis_result = analytics.analyze_call(audio_path, config)
+    return audio_path, audio_stream
+
+
+def audio_id_headers(audio_path, audio_stream):
+    """
+    Returns the X-Audio-Id header naming the analyzed audio. Unsaved uploads get
+    no header, since their id does not refer to a file that can be reused.
+    """
+    if audio_stream is not None:
+        return {}
+    return {"X-Audio-Id": os.path.basename(audio_path)}
+
+
+def sse_event(payload, event=None):
+    """Formats a payload as a server-sent event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload)}\n\n"
+
+
+@app.post("/analyze_audio", summary="Analyze an audio file")
+async def analyze_audio(
+    audio_id: Optional[str] = Form(None),
+    file: Optional[UploadFile] = File(None),
+    save_file: bool = Form(True),
+    force: bool = Form(False)
+):
+    audio_path, audio_stream = await resolve_audio_input(audio_id, file, save_file)
+
+    # The Gemini request is synchronous and slow, so keep it off the event loop
+    analysis_result = await asyncio.to_thread(
+        analytics.analyze_call, audio_path, config, audio_stream, force
+    )
 
     if "error" in analysis_result:
         raise HTTPException(status_code=500, detail=analysis_result["error"])
 
-    return JSONResponse(content=analysis_result)
+    return JSONResponse(
+        content=analysis_result,
+        headers=audio_id_headers(audio_path, audio_stream)
+    )
+
+
+@app.post("/analyze_audio/stream", summary="Analyze an audio file, streaming the model output")
+async def analyze_audio_stream(
+    audio_id: Optional[str] = Form(None),
+    file: Optional[UploadFile] = File(None),
+    save_file: bool = Form(True),
+    force: bool = Form(False)
+):
+    """
+    Streams the model output as server-sent events while it is generated.
+    Each text delta is sent as a default event with a 'delta' field, and the
+    parsed analysis (or an error) is sent last as a 'result' event.
+    """
+    audio_path, audio_stream = await resolve_audio_input(audio_id, file, save_file)
+    headers = audio_id_headers(audio_path, audio_stream)
+
+    # A stored analysis is sent straight away as the only event
+    if not force:
+        cached_analysis = await asyncio.to_thread(analytics.load_cached_analysis, audio_path)
+        if cached_analysis is not None:
+            return StreamingResponse(
+                iter([sse_event(cached_analysis, event="result")]),
+                media_type="text/event-stream",
+                headers=headers
+            )
+
+    # Upload before responding so the request body is still open and upload
+    # failures are reported as a regular HTTP error
+    try:
+        audio_file = await asyncio.to_thread(analytics.upload_audio, audio_path, audio_stream)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def event_stream():
+        response_parts = []
+        try:
+            async for text in analytics.stream_call(audio_file, config):
+                response_parts.append(text)
+                # Split oversized bursts so clients render them incrementally
+                for start in range(0, len(text), STREAM_MAX_DELTA):
+                    yield sse_event({"delta": text[start:start + STREAM_MAX_DELTA]})
+
+            # stream_call raises if the model returned no text
+            full_response_text = "".join(response_parts)
+            result = await asyncio.to_thread(analytics.save_analysis, audio_path, full_response_text)
+        except Exception as e:
+            print(f"An error occurred during analysis: {e}")
+            result = {"error": str(e)}
+        finally:
+            await asyncio.to_thread(analytics.delete_uploaded_audio, audio_file)
+
+        yield sse_event(result, event="result")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers=headers
+    )
 
 
 @app.get("/export_data", summary="Export analysis results as JSON")
 def export_data(analysis_id: str):
-    analysis_path = os.path.join(analytics.ANALYSIS_DIR, analysis_id)
+    analysis_path = resolve_id(ANALYSIS_DIR_ABS, analysis_id, "analysis_id")
     if not os.path.exists(analysis_path):
         raise HTTPException(status_code=404, detail=f"Analysis with id '{analysis_id}' not found.")
 
-    with open(analysis_path, 'r') as f:
-        data = json.load(f)
-    return JSONResponse(content=data)
+    # The analysis is already stored as JSON, so send the file as-is
+    return FileResponse(analysis_path, media_type="application/json", filename=analysis_id)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Multiple workers need the app as an import string so each process can load it;
+    # app_dir lets them import it when started from another directory
+    uvicorn.run(
+        "app:app",
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        host="0.0.0.0",
+        port=8000,
+        workers=max(2, os.cpu_count() or 1),
+        loop="uvloop",
+        http="httptools",
+        log_level="info"
+    )
@@ -1,16 +1,45 @@
 import os
-import base64
-import yaml
+import re
 import json
+import tempfile
+import yaml
+import orjson
+from dataclasses import dataclass
+from functools import lru_cache
 from dotenv import load_dotenv
 import google.generativeai as genai
 
+# Data and config files live next to this module, whatever the working directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 # Load environment variables from .env file
-load_dotenv()
+load_dotenv(os.path.join(BASE_DIR, ".env"))
 
 # --- Configuration and Constants ---
-AUDIO_DIR = "audio_files"
-ANALYSIS_DIR = "analysis_results"
+AUDIO_DIR = os.path.join(BASE_DIR, "audio_files")
+ANALYSIS_DIR = os.path.join(BASE_DIR, "analysis_results")
+SUPPORTED_EXTS = (".mp3", ".wav", ".m4a", ".ogg")
+
+# Uploads are named by a hex digest of this many bytes, so their contents never change
+CONTENT_HASH_SIZE = 16
+CONTENT_ID_RE = re.compile(rf"[0-9a-f]{{{CONTENT_HASH_SIZE * 2}}}\.[A-Za-z0-9]+")
+MIME_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".wav": "audio/wav",
+    ".m4a": "audio/m4a",
+    ".ogg": "audio/ogg",
+}
+
+# Prefer the libyaml-backed loader when PyYAML was built with it
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Markdown code fences the model sometimes wraps its output in
+FENCE_RE = re.compile(r"```(?:yaml|json)?")
+
+# Configure the Gemini API client once at import time
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+if GEMINI_API_KEY:
+    genai.configure(api_key=GEMINI_API_KEY)
 
 
 def setup_directories():
@@ -19,112 +48,263 @@ def setup_directories():
     os.makedirs(ANALYSIS_DIR, exist_ok=True)
 
 
-def load_config(config_path="config.yaml"):
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Settings loaded from config.yaml."""
+    model_name: str
+    system_instruction: str
+    prompt: str
+
+
+def load_config(config_path=os.path.join(BASE_DIR, "config.yaml")):
     """Loads the configuration from a YAML file."""
     with open(config_path, 'r') as f:
-        return yaml.safe_load(f)
+        return Config(**yaml.load(f, Loader=YAML_LOADER))
 
 
-def encode_audio(audio_path):
-    """Encodes the audio file to base64."""
-    with open(audio_path, "rb") as audio_file:
-        return base64.b64encode(audio_file.read()).decode('utf-8')
+@lru_cache(maxsize=8)
+def get_model(model_name, system_instruction):
+    """Returns a cached generative model instance for the given settings."""
+    if not GEMINI_API_KEY:
+        raise ValueError("GEMINI_API_KEY not found in environment variables.")
+    return genai.GenerativeModel(
+        model_name=model_name,
+        system_instruction=system_instruction
+    )
 
 
-def analyze_call(audio_path, config):
+def upload_audio(audio_path, audio_stream=None):
+    """
+    Uploads audio to the Gemini Files API so it is streamed instead of being
+    read into memory and base64-encoded.
+
+    Args:
+        audio_path (str): The path to the audio file.
+        audio_stream (file-like, optional): Open audio data to upload instead of
+            reading from audio_path. audio_path is then only used for naming.
+
+    Returns:
+        File: The uploaded file handle.
+    """
+    # Determine the correct mime type based on file extension
+    file_extension = os.path.splitext(audio_path)[1].lower()
+    mime_type = MIME_TYPES.get(file_extension)
+    if not mime_type:
+        raise ValueError(f"Unsupported audio file format: {file_extension}")
+
+    return genai.upload_file(
+        path=audio_stream if audio_stream is not None else audio_path,
+        mime_type=mime_type,
+        display_name=os.path.basename(audio_path)
+    )
+
+
+def delete_uploaded_audio(audio_file):
+    """Deletes an uploaded audio file from the Gemini Files API."""
+    try:
+        genai.delete_file(audio_file.name)
+    except Exception as e:
+        print(f"Warning: Could not delete uploaded file {audio_file.name}. Error: {e}")
+
+
+def get_analysis_path(audio_path):
+    """Returns where the analysis of an audio file is stored."""
+    audio_filename = os.path.basename(audio_path)
+    analysis_filename = os.path.splitext(audio_filename)[0] + ".json"
+    return os.path.join(ANALYSIS_DIR, analysis_filename)
+
+
+def get_analysis_meta_path(audio_path):
+    """Returns where the source details of a stored analysis are recorded."""
+    audio_stem = os.path.splitext(os.path.basename(audio_path))[0]
+    return os.path.join(ANALYSIS_DIR, f".{audio_stem}.meta.json")
+
+
+def describe_audio_source(audio_path):
+    """Returns the details that identify which audio file an analysis came from."""
+    source = {"audio_filename": os.path.basename(audio_path)}
+    # Content-addressed ids (and unsaved uploads) can't change under the same name
+    if not CONTENT_ID_RE.fullmatch(source["audio_filename"]):
+        st = os.stat(audio_path)
+        source["size"] = st.st_size
+        source["mtime_ns"] = st.st_mtime_ns
+    return source
+
+
+def load_cached_analysis(audio_path):
+    """
+    Returns the stored analysis of an audio file, or None if there is none or it
+    was produced from a different file, e.g. 'call.wav' for 'call.mp3'.
+    """
+    try:
+        with open(get_analysis_meta_path(audio_path), "rb") as f:
+            recorded_source = orjson.loads(f.read())
+        if recorded_source != describe_audio_source(audio_path):
+            return None
+        with open(get_analysis_path(audio_path), "rb") as f:
+            return orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+
+
+def serialize_analysis(analysis_data):
+    """Encodes an analysis report as indented JSON bytes."""
+    try:
+        return orjson.dumps(analysis_data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    except orjson.JSONEncodeError:
+        # orjson rejects integers wider than 64 bits, e.g. unquoted phone numbers
+        return json.dumps(analysis_data, indent=2, default=str).encode("utf-8")
+
+
+def write_file_atomic(path, data):
+    """Writes bytes to a temporary file and moves it into place, so readers never see a partial file."""
+    fd, temp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def save_analysis(audio_path, full_response_text):
+    """
+    Parses the model output and saves it next to the other analysis results.
+
+    Args:
+        audio_path (str): The path to the analyzed audio file.
+        full_response_text (str): The complete text returned by the model.
+
+    Returns:
+        dict: The parsed analysis report or an error message.
+    """
+    analysis_path = get_analysis_path(audio_path)
+
+    # The response from Gemini is a YAML-formatted string, so we parse it.
+    try:
+        # Clean the response text to ensure it's valid YAML/JSON
+        cleaned_text = FENCE_RE.sub("", full_response_text).strip()
+        analysis_data = yaml.load(cleaned_text, Loader=YAML_LOADER)
+        analysis_json = serialize_analysis(analysis_data)
+    except (yaml.YAMLError, TypeError, ValueError) as parse_error:
+        print(f"Warning: Could not parse model output as YAML/JSON. Saving raw text. Error: {parse_error}")
+        # Save raw text if parsing fails
+        with open(analysis_path.replace('.json', '.txt'), "w") as f:
+            f.write(full_response_text)
+        return {"error": "Failed to parse model output", "raw_output": full_response_text}
+
+    # Drop the old source record first so the new analysis is never matched to it
+    meta_path = get_analysis_meta_path(audio_path)
+    try:
+        os.unlink(meta_path)
+    except FileNotFoundError:
+        pass
+    write_file_atomic(analysis_path, analysis_json)
+    try:
+        write_file_atomic(meta_path, orjson.dumps(describe_audio_source(audio_path)))
+    except OSError as e:
+        print(f"Warning: Could not record the source of {analysis_path}. Error: {e}")
+    return analysis_data
+
+
+def describe_empty_response(response_stream):
+    """Explains why a model response contained no text."""
+    # Check for a more descriptive finish reason if the response is empty
+    try:
+        finish_reason = response_stream.candidates[0].finish_reason
+        if finish_reason != 1:  # 1 is STOP
+            return f"API call finished prematurely. Reason: {finish_reason.name}"
+    except (IndexError, AttributeError):
+        pass  # Fallback to generic error
+    return "Received an empty response from the API."
+
+
+def analyze_call(audio_path, config, audio_stream=None, force=False):
     """
     Analyzes the call center audio using the Gemini API with a streaming response.
 
     Args:
         audio_path (str): The path to the audio file.
-        config (dict): The configuration dictionary.
+        config (Config): The loaded configuration.
+        audio_stream (file-like, optional): Open audio data to upload instead of
+            reading from audio_path. audio_path is then only used for naming.
+        force (bool): Re-run the analysis even if a stored result exists.
 
     Returns:
         dict: A dictionary containing the parsed analysis report or an error message.
     """
     try:
-        # Configure the Gemini API client
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not found in environment variables.")
-        genai.configure(api_key=api_key)
-
-        # Create the generative model instance with the system instruction
-        model = genai.GenerativeModel(
-            model_name=config['model_name'],
-            system_instruction=config['system_instruction']
-        )
-
-        # Determine the correct mime type based on file extension
-        file_extension = os.path.splitext(audio_path)[1].lower()
-        mime_types = {
-            ".mp3": "audio/mpeg",
-            ".wav": "audio/wav",
-            ".m4a": "audio/m4a",
-            ".ogg": "audio/ogg",
-        }
-        mime_type = mime_types.get(file_extension)
-        if not mime_type:
-            raise ValueError(f"Unsupported audio file format: {file_extension}")
-
-        # Prepare the request contents, including the prompt and audio file
-        contents = [
-            config['prompt'],
-            {
-                "mime_type": mime_type,
-                "data": encode_audio(audio_path)
-            }
-        ]
-
-        # Generate the content using a streaming request
-        # FIX: Removed the unnecessary 'tools' parameter to prevent tool-use errors.
-        response_stream = model.generate_content(
-            contents,
-            stream=True
-        )
-
-        # Aggregate the response text from all chunks in the stream
-        full_response_text = ""
-        for chunk in response_stream:
-            # Add a check to ensure chunk.text exists before appending
-            if chunk.text:
-                full_response_text += chunk.text
+        # Reuse a previous analysis of the same audio instead of calling Gemini again
+        if not force:
+            cached_analysis = load_cached_analysis(audio_path)
+            if cached_analysis is not None:
+                return cached_analysis
+
+        # Reuse the generative model instance with the system instruction
+        model = get_model(config.model_name, config.system_instruction)
+
+        audio_file = upload_audio(audio_path, audio_stream)
 
-        if not full_response_text.strip():
-            # Check for a more descriptive finish reason if the response is empty
-            try:
-                finish_reason = response_stream.candidates[0].finish_reason
-                if finish_reason != 1:  # 1 is STOP
-                    return {"error": f"API call finished prematurely. Reason: {finish_reason.name}"}
-            except (IndexError, AttributeError):
-                pass  # Fallback to generic error
-            return {"error": "Received an empty response from the API."}
-
-        # Save the analysis result
-        audio_filename = os.path.basename(audio_path)
-        analysis_filename = os.path.splitext(audio_filename)[0] + ".json"
-        analysis_path = os.path.join(ANALYSIS_DIR, analysis_filename)
-
-        # The response from Gemini is a YAML-formatted string, so we parse it.
         try:
-            # Clean the response text to ensure it's valid YAML/JSON
-            cleaned_text = full_response_text.strip().replace("```yaml", "").replace("```", "")
-            analysis_data = yaml.safe_load(cleaned_text)
-            with open(analysis_path, "w") as f:
-                json.dump(analysis_data, f, indent=4)
-        except (yaml.YAMLError, json.JSONDecodeError) as parse_error:
-            print(f"Warning: Could not parse model output as YAML/JSON. Saving raw text. Error: {parse_error}")
-            # Save raw text if parsing fails
-            with open(analysis_path.replace('.json', '.txt'), "w") as f:
-                f.write(full_response_text)
-            return {"error": "Failed to parse model output", "raw_output": full_response_text}
-
-        return analysis_data
+            # Prepare the request contents, including the prompt and audio file
+            contents = [config.prompt, audio_file]
+
+            # Generate the content using a streaming request
+            # FIX: Removed the unnecessary 'tools' parameter to prevent tool-use errors.
+            response_stream = model.generate_content(
+                contents,
+                stream=True
+            )
+
+            # Aggregate the response text from all chunks in the stream
+            response_parts = []
+            for chunk in response_stream:
+                # Add a check to ensure chunk.text exists before appending
+                if chunk.text:
+                    response_parts.append(chunk.text)
+            full_response_text = "".join(response_parts)
+        finally:
+            delete_uploaded_audio(audio_file)
+
+        if not full_response_text.strip():
+            return {"error": describe_empty_response(response_stream)}
+
+        return save_analysis(audio_path, full_response_text)
 
     except Exception as e:
         print(f"An error occurred during analysis: {e}")
         return {"error": str(e)}
 
 
+async def stream_call(audio_file, config):
+    """
+    Streams the analysis of an uploaded audio file as the model generates it.
+
+    Args:
+        audio_file (File): The audio handle returned by upload_audio.
+        config (Config): The loaded configuration.
+
+    Yields:
+        str: Pieces of the response text as they arrive.
+
+    Raises:
+        ValueError: If the model returns no text, explaining why.
+    """
+    model = get_model(config.model_name, config.system_instruction)
+    response_stream = await model.generate_content_async(
+        [config.prompt, audio_file],
+        stream=True
+    )
+    has_text = False
+    async for chunk in response_stream:
+        if chunk.text:
+            has_text = has_text or not chunk.text.isspace()
+            yield chunk.text
+
+    if not has_text:
+        raise ValueError(describe_empty_response(response_stream))
+
+
 # Initial setup when the module is loaded
 setup_directories()
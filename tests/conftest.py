@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# app.py and main.py are top-level modules, and the tests read the bundled
+# sample audio through repository-relative paths
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
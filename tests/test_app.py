@@ -0,0 +1,131 @@
+import os
+import wave
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app
+import main as analytics
+
+
+class FakeModel:
+    """Stands in for the Gemini model and counts how often it is called."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, contents, stream=False):
+        self.calls += 1
+        return [SimpleNamespace(text="assessment:\n  summary: ok\n")]
+
+
+@pytest.fixture
+def model(tmp_path, monkeypatch):
+    audio_dir = tmp_path / "audio"
+    analysis_dir = tmp_path / "analysis"
+    audio_dir.mkdir()
+    analysis_dir.mkdir()
+    monkeypatch.setattr(app, "AUDIO_DIR_ABS", str(audio_dir))
+    monkeypatch.setattr(analytics, "ANALYSIS_DIR", str(analysis_dir))
+
+    fake_model = FakeModel()
+    monkeypatch.setattr(analytics, "get_model", lambda *args: fake_model)
+    monkeypatch.setattr(analytics.genai, "upload_file", lambda **kwargs: SimpleNamespace(name="files/test"))
+    monkeypatch.setattr(analytics.genai, "delete_file", lambda name: None)
+    return fake_model
+
+
+def test_repeated_upload_reuses_stored_analysis(model):
+    client = TestClient(app.app)
+    with open("audio_files/68a8588e6be1d80533328431.mp3", "rb") as f:
+        audio = f.read()
+
+    first = client.post("/analyze_audio", files={"file": ("call.mp3", audio, "audio/mpeg")})
+    second = client.post("/analyze_audio", files={"file": ("again.mp3", audio, "audio/mpeg")})
+
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert second.json() == first.json() == {"assessment": {"summary": "ok"}}
+    assert second.headers["X-Audio-Id"] == first.headers["X-Audio-Id"]
+    assert model.calls == 1
+
+
+def test_list_audio_does_not_cache_a_scan_overtaken_by_an_upload(monkeypatch):
+    monkeypatch.setattr(app, "_LIST_SNAPSHOT", None)
+    scans = []
+
+    async def scan_audio_files():
+        scans.append(len(scans))
+        if len(scans) == 1:
+            # An upload lands while the first scan is still running
+            app.invalidate_audio_list()
+        return {"audio_files": [], "scan": len(scans)}
+
+    monkeypatch.setattr(app, "scan_audio_files", scan_audio_files)
+    client = TestClient(app.app)
+
+    assert client.get("/list_audio").json()["scan"] == 1
+    assert client.get("/list_audio").json()["scan"] == 2
+    assert client.get("/list_audio").json()["scan"] == 2
+
+
+@pytest.mark.parametrize("audio_id", ["../main.py", "..", ".env", "sub/call.mp3", "call\0.mp3"])
+def test_analyze_audio_rejects_ids_outside_the_audio_directory(model, audio_id):
+    response = TestClient(app.app).post("/analyze_audio", data={"audio_id": audio_id})
+
+    assert response.status_code == 400
+    assert model.calls == 0
+
+
+def test_analyze_audio_accepts_ordinary_file_names(model):
+    audio_id = "Call 1 (Ravi).mp3"
+    with open("audio_files/68a8588e6be1d80533328431.mp3", "rb") as src:
+        (Path(app.AUDIO_DIR_ABS) / audio_id).write_bytes(src.read())
+
+    response = TestClient(app.app).post("/analyze_audio", data={"audio_id": audio_id})
+
+    assert response.status_code == 200
+    assert model.calls == 1
+
+
+@pytest.mark.parametrize("analysis_id", ["../main.py", "..", ".duration_cache.json"])
+def test_export_data_rejects_ids_outside_the_analysis_directory(analysis_id):
+    response = TestClient(app.app).get("/export_data", params={"analysis_id": analysis_id})
+
+    assert response.status_code == 400
+
+
+def test_cached_analysis_is_keyed_on_the_full_audio_file_name(model):
+    client = TestClient(app.app)
+    audio_dir = Path(app.AUDIO_DIR_ABS)
+    with open("audio_files/68a8588e6be1d80533328431.mp3", "rb") as src:
+        (audio_dir / "call.mp3").write_bytes(src.read())
+    with wave.open(str(audio_dir / "call.wav"), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(b"\0" * 16000)
+
+    for audio_id, expected_calls in [("call.mp3", 1), ("call.wav", 2), ("call.wav", 2), ("call.mp3", 3)]:
+        response = client.post("/analyze_audio", data={"audio_id": audio_id})
+        assert response.status_code == 200
+        assert model.calls == expected_calls, audio_id
+
+
+def test_cached_analysis_is_not_reused_for_a_replaced_file_with_an_older_mtime(model):
+    client = TestClient(app.app)
+    audio_path = Path(app.AUDIO_DIR_ABS) / "call.mp3"
+    with open("audio_files/68a8588e6be1d80533328431.mp3", "rb") as src:
+        audio = src.read()
+    audio_path.write_bytes(audio)
+    old_times = (audio_path.stat().st_atime, audio_path.stat().st_mtime)
+
+    client.post("/analyze_audio", data={"audio_id": "call.mp3"})
+    # Copy a different recording over it while keeping the old mtime, as cp -p does
+    audio_path.write_bytes(audio[:-1000])
+    os.utime(audio_path, old_times)
+    client.post("/analyze_audio", data={"audio_id": "call.mp3"})
+
+    assert model.calls == 2
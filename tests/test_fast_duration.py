@@ -0,0 +1,105 @@
+import glob
+import os
+import struct
+import wave
+
+import pytest
+from mutagen.mp3 import MP3
+from mutagen.ogg import OggPage
+from mutagen.oggvorbis import OggVorbis
+from mutagen.wave import WAVE
+
+import fast_duration
+
+SAMPLE_MP3S = sorted(glob.glob("audio_files/*.mp3") + glob.glob("untitled folder/*.mp3"))
+
+
+@pytest.mark.parametrize("path", SAMPLE_MP3S, ids=os.path.basename)
+def test_mp3_duration_matches_mutagen(path):
+    assert fast_duration.audio_duration(path) == pytest.approx(MP3(path).info.length, abs=1e-6)
+
+
+def test_wav_duration_matches_mutagen(tmp_path):
+    path = str(tmp_path / "tone.wav")
+    with wave.open(path, "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(b"\0" * 4 * 8000 * 3)
+
+    assert fast_duration.audio_duration(path) == pytest.approx(WAVE(path).info.length)
+
+
+def test_m4a_duration_reads_mvhd(tmp_path):
+    mvhd_payload = struct.pack(">B3sIIII", 0, b"\0\0\0", 0, 0, 1000, 12345) + b"\0" * 80
+    mvhd = struct.pack(">I4s", 8 + len(mvhd_payload), b"mvhd") + mvhd_payload
+    moov = struct.pack(">I4s", 8 + len(mvhd), b"moov") + mvhd
+    ftyp = struct.pack(">I4s", 16, b"ftyp") + b"M4A \0\0\0\0"
+    path = tmp_path / "call.m4a"
+    path.write_bytes(ftyp + struct.pack(">I4s", 8, b"free") + moov)
+
+    assert fast_duration.audio_duration(str(path)) == pytest.approx(12.345)
+
+
+def _ogg_page(packets, sequence, position, first=False, last=False):
+    page = OggPage()
+    page.packets = packets
+    page.serial = 1234
+    page.sequence = sequence
+    page.position = position
+    page.first = first
+    page.last = last
+    return page.write()
+
+
+def _ogg_vorbis(final_position):
+    """Builds a minimal Ogg Vorbis stream at 44.1 kHz ending at final_position."""
+    ident = b"\x01vorbis" + struct.pack("<IBIiiiBB", 0, 2, 44100, 0, 128000, 0, 0xB8, 1)
+    comment = b"\x03vorbis" + struct.pack("<I", 4) + b"test" + struct.pack("<I", 0) + b"\x01"
+    setup = b"\x05vorbis" + b"\0" * 20
+    return (
+        _ogg_page([ident], 0, 0, first=True)
+        + _ogg_page([comment, setup], 1, 0)
+        + _ogg_page([b"\0" * 3000], 2, 44100)
+        # Packet data that happens to contain the capture pattern
+        + _ogg_page([b"xxOggS\0" + b"\0" * 200], 3, final_position, last=True)
+    )
+
+
+def test_ogg_duration_matches_mutagen(tmp_path):
+    path = tmp_path / "call.ogg"
+    path.write_bytes(_ogg_vorbis(44100 * 3 + 500))
+
+    assert fast_duration.audio_duration(str(path)) == pytest.approx(OggVorbis(str(path)).info.length)
+
+
+def test_ogg_without_final_granule_raises_value_error(tmp_path):
+    path = tmp_path / "call.ogg"
+    path.write_bytes(_ogg_vorbis(-1))
+
+    with pytest.raises(ValueError):
+        fast_duration.audio_duration(str(path))
+
+
+@pytest.mark.parametrize("filename, data", [
+    ("empty.mp3", b""),
+    ("noise.mp3", b"\x00\x01\x02" * 100),
+    ("truncated.mp3", b"ID3\x04\x00\x00\x00\x00\x00\x10"),
+    ("empty.wav", b""),
+    ("not_riff.wav", b"RIFX\x00\x00\x00\x00WAVE"),
+    ("no_data.wav", b"RIFF\x00\x00\x00\x00WAVEfmt \x10\x00\x00\x00" + b"\x00" * 16),
+    ("truncated_fmt.wav", b"RIFF\x00\x00\x00\x00WAVEfmt \x10\x00\x00\x00\x01"),
+    ("empty.m4a", b""),
+    ("no_moov.m4a", struct.pack(">I4s", 16, b"ftyp") + b"M4A \0\0\0\0"),
+    ("bad_atom.m4a", struct.pack(">I4s", 4, b"ftyp")),
+    ("truncated_mvhd.m4a", struct.pack(">I4s", 16, b"moov") + struct.pack(">I4s", 8, b"mvhd")),
+    ("empty.ogg", b""),
+    ("not_vorbis.ogg", b"OggS" + b"\x00" * 60),
+    ("unsupported.flac", b"fLaC"),
+])
+def test_malformed_headers_raise_value_error(tmp_path, filename, data):
+    path = tmp_path / filename
+    path.write_bytes(data)
+
+    with pytest.raises(ValueError):
+        fast_duration.audio_duration(str(path))
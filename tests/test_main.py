@@ -0,0 +1,14 @@
+import json
+
+import main as analytics
+
+
+def test_save_analysis_keeps_integers_wider_than_64_bits(tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics, "ANALYSIS_DIR", str(tmp_path))
+
+    result = analytics.save_analysis("call.mp3", "customer:\n  phone: 123456789012345678901234\n  1: first\n")
+
+    expected = {"customer": {"phone": 123456789012345678901234, "1": "first"}}
+    assert json.loads((tmp_path / "call.json").read_text()) == expected
+    assert result == {"customer": {"phone": 123456789012345678901234, 1: "first"}}
+    assert [p.name for p in tmp_path.iterdir()] == ["call.json"]